@@ -1,17 +1,103 @@
 import abc
-import json
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
+import enum
+import functools
+import itertools
+import logging
+import multiprocessing
+import os
 import pprint
-import socket
 import struct
-import threading
 import typing
-import uuid
 from abc import ABC
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import msgspec
 
 import broomrocket
 from broomrocket import LoadedMesh, GLTF, BroomrocketLogger, Broomrocket, Volume
 
+logger = logging.getLogger(__name__)
+
+# Every message is prefixed with the length of its payload.
+_HEADER = struct.Struct("<I")
+
+
+class MessageType(enum.IntEnum):
+    REQUEST = 0
+    RESPONSE = 1
+
+
+class Command(enum.IntEnum):
+    """
+    These are the commands the server can send to the client.
+    """
+    LOAD_GLTF = 1
+    LIST_OBJECTS = 2
+    MOVE_MESH = 3
+
+
+class WireCoordinate(msgspec.Struct):
+    x: float
+    y: float
+    z: float
+
+
+class WireVolume(msgspec.Struct):
+    min_x: float
+    max_x: float
+    min_y: float
+    max_y: float
+    min_z: float
+    max_z: float
+
+
+class WireMesh(msgspec.Struct):
+    """
+    This is the description of a mesh as sent by the client.
+    """
+    name: str
+    volume: WireVolume
+    translation: WireCoordinate
+
+
+class WireLoadGLTFResponse(msgspec.Struct):
+    object: WireMesh
+
+
+class WireListObjectsResponse(msgspec.Struct):
+    objects: typing.List[WireMesh]
+
+
+class WireGLTF(msgspec.Struct):
+    """
+    This is the GLTF data set sent to the client. The file contents are sent as raw MessagePack binaries instead of
+    base64-encoded strings.
+    """
+    files: typing.Dict[str, bytes]
+    gltf_file: str
+    license_file: typing.Optional[str] = None
+
+
+class WireClientRequest(msgspec.Struct):
+    mesh_provider_id: str
+    mesh_provider_parameters: typing.Dict[str, str]
+    sentence: str
+
+
+class WireMessage(msgspec.Struct):
+    """
+    This is the envelope of every message. The data field is left encoded so that it can be decoded directly into the
+    type the receiver expects for the message.
+    """
+    # Kept as a plain integer so that messages of unknown types can be skipped instead of failing validation.
+    type: int
+    id: str
+    data: msgspec.Raw
+
 
 class SocketLoadedMesh(LoadedMesh):
     """
@@ -43,30 +129,31 @@ class SocketLoadedMesh(LoadedMesh):
         return self.size
 
     @classmethod
-    def from_dict(
+    def from_wire(
             cls,
             message_handler: typing.ForwardRef("MessageHandler"),
-            data: typing.Dict
+            mesh: WireMesh
     ) -> typing.ForwardRef("SocketLoadedMesh"):
+        volume = mesh.volume
+        translation = mesh.translation
         return cls(
             message_handler,
-            data["name"],
-            broomrocket.Volume.from_dict(data["volume"]),
-            SocketCoordinate.from_dict(data["translation"])
+            mesh.name,
+            broomrocket.Volume(
+                volume.min_x, volume.max_x, volume.min_y, volume.max_y, volume.min_z, volume.max_z
+            ),
+            SocketCoordinate(translation.x, translation.y, translation.z)
         )
 
     def _translation_changed(self):
-        self.message_handler.send_request({
-            "command": "move_mesh",
-            "name": self.name,
-            "translation": self.translation.to_dict()
-        })
+        self.message_handler.mesh_moved(self)
 
     @property
     def translation(self) -> broomrocket.Coordinate:
         """
-        Translation returns the coordinate of the root/pivot point of the mesh. The returned coordinate must, when
-        changed, translate those changes back to the mesh even when the setter below is not called explicitly.
+        Translation returns the coordinate of the root/pivot point of the mesh. Only changes made through the
+        coordinate's set(), set_axis() or notify() methods, or through the setter below, are sent to the client.
+        Assigning an axis directly changes the value locally only; call notify() afterwards to move the mesh.
         """
         return self._translation
 
@@ -75,13 +162,51 @@ class SocketLoadedMesh(LoadedMesh):
         """
         This setter moves the mesh to have its root/pivot point to the specified coordinates.
         """
-        self._translation = SocketCoordinate(
-            translation.x,
-            translation.y,
-            translation.z
-        )
-        self._translation.change_callback = self._translation_changed
-        self._translation_changed()
+        self._translation.set(translation.x, translation.y, translation.z)
+
+
+class PendingSocketLoadedMesh(LoadedMesh):
+    """
+    This mesh stands in for a mesh whose load_gltf request is still in flight, so several meshes can be loaded at the
+    same time. Accessing it waits for the client's response.
+    """
+
+    message_handler: typing.ForwardRef("MessageHandler")
+    _response: concurrent.futures.Future
+    _mesh: typing.Optional[SocketLoadedMesh]
+
+    def __init__(self, message_handler: typing.ForwardRef("MessageHandler"), response: concurrent.futures.Future):
+        self.message_handler = message_handler
+        self._response = response
+        self._mesh = None
+
+    @property
+    def mesh(self) -> SocketLoadedMesh:
+        if self._mesh is None:
+            self._mesh = SocketLoadedMesh.from_wire(
+                self.message_handler,
+                self.message_handler.load_gltf_decoder.decode(self._response.result()).object
+            )
+        return self._mesh
+
+    @property
+    def name(self) -> str:
+        return self.mesh.name
+
+    @property
+    def size(self) -> Volume:
+        return self.mesh.size
+
+    def get_size_submesh_fallback(self, name: str) -> broomrocket.Volume:
+        return self.mesh.get_size_submesh_fallback(name)
+
+    @property
+    def translation(self) -> broomrocket.Coordinate:
+        return self.mesh.translation
+
+    @translation.setter
+    def translation(self, translation: broomrocket.Coordinate):
+        self.mesh.translation = translation
 
 
 class MessageWriter(abc.ABC):
@@ -92,7 +217,7 @@ class MessageWriter(abc.ABC):
 
 class MessageReader(abc.ABC):
     @abc.abstractmethod
-    def read_next(self):
+    async def read_next(self):
         pass
 
 
@@ -107,68 +232,57 @@ class SocketEngine(broomrocket.Engine):
         self.message_handler = message_handler
 
     def load_gltf(self, name: str, data: GLTF, logger: BroomrocketLogger) -> LoadedMesh:
-        response = self.message_handler.send_request({
-            "command": "load_gltf",
+        self.message_handler.flush_moves()
+        response = self.message_handler.submit_request({
+            "command": Command.LOAD_GLTF,
             "name": name,
-            "gltf": data.to_dict()
+            "gltf": WireGLTF(data.files, data.gltf_file, data.license_file)
         })
-        return SocketLoadedMesh.from_dict(self.message_handler, response["object"])
+        return PendingSocketLoadedMesh(self.message_handler, response)
 
     def list_objects(self) -> typing.List[LoadedMesh]:
-        response = self.message_handler.send_request({
-            "command": "list_objects"
+        self.message_handler.flush_moves()
+        response = self.message_handler.send_request_blocking({
+            "command": Command.LIST_OBJECTS
         })
         result = []
-        for obj in response["objects"]:
-            result.append(SocketLoadedMesh.from_dict(self.message_handler, obj))
+        for obj in self.message_handler.list_objects_decoder.decode(response).objects:
+            result.append(SocketLoadedMesh.from_wire(self.message_handler, obj))
         return result
 
 
 class SocketCoordinate(broomrocket.Coordinate):
-    _x: float
-    _y: float
-    _z: float
-
-    change_callback: typing.Callable
-
-    def __init__(self, x: float, y: float, z: float):
-        self._x = x
-        self._y = y
-        self._z = z
+    """
+    This coordinate reports changes to the mesh it belongs to. The axes are plain attributes, so assigning them directly
+    does not report anything; call notify() afterwards. set() and set_axis() notify on their own.
+    """
+    __slots__ = ("x", "y", "z", "change_callback")
 
-    @property
-    def x(self) -> float:
-        return self._x
+    x: float
+    y: float
+    z: float
 
-    @x.setter
-    def x(self, x: float):
-        self._x = x
-        if self.change_callback is not None:
-            self.change_callback()
+    change_callback: typing.Optional[typing.Callable]
 
-    @property
-    def y(self) -> float:
-        return self._y
+    def __init__(self, x: float, y: float, z: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.change_callback = None
 
-    @y.setter
-    def y(self, y: float):
-        self._y = y
+    def notify(self):
         if self.change_callback is not None:
             self.change_callback()
 
-    @property
-    def z(self) -> float:
-        return self._z
-
-    @z.setter
-    def z(self, z: float):
-        self._z = z
-        if self.change_callback is not None:
-            self.change_callback()
+    def set(self, x: float, y: float, z: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.notify()
 
-    @classmethod
-    def from_dict(cls, param: typing.Dict[str, float]) -> broomrocket.Coordinate:
-        return SocketCoordinate(param["x"], param["y"], param["z"])
+    def set_axis(self, axis: broomrocket.Axis, value: float):
+        setattr(self, str(axis), value)
+        self.notify()
 
     def to_dict(self) -> dict:
         return {
@@ -178,22 +292,58 @@ class SocketCoordinate(broomrocket.Coordinate):
         }
 
 
-class MessageHandler:
-    broomrocket: Broomrocket
+_worker_nlp: typing.Optional[broomrocket.NLPProvider] = None
 
-    def __init__(self, message_writer: MessageWriter, message_reader: MessageReader):
-        self.message_queue = {}
-        self.message_writer = message_writer
-        self.message_reader = message_reader
 
-        self.broomrocket = broomrocket.Broomrocket(
-            SocketEngine(self),
+def _init_nlp_worker():
+    global _worker_nlp
+    _worker_nlp = broomrocket.SpaCyNLPProvider()
+
+
+def _check_worker():
+    pass
+
+
+def _parse_in_worker(sentence: str) -> broomrocket.NLPParseResult:
+    return _worker_nlp.parse(sentence, broomrocket.PythonLogger())
+
+
+class ProcessPoolNLPProvider(broomrocket.NLPProvider):
+    """
+    This NLP provider parses sentences with spaCy in worker processes, so that parsing several sentences at the same
+    time is not limited by the GIL. Messages logged during parsing go to the logging setup of the worker process.
+    """
+
+    def __init__(self, executor: ProcessPoolExecutor):
+        self._executor = executor
+
+    def parse(self, sentence: str, logger: BroomrocketLogger) -> broomrocket.NLPParseResult:
+        return self._executor.submit(_parse_in_worker, sentence).result()
+
+
+@dataclasses.dataclass
+class BroomrocketComponents:
+    """
+    These are the parts of the Broomrocket pipeline that do not depend on the connection. Loading them is expensive
+    (the spaCy model alone takes several seconds), so they are created once at startup and shared by all connections.
+    """
+    mesh_providers: typing.List[broomrocket.MeshProvider]
+    nlp: broomrocket.NLPProvider
+    reference_finders: typing.List[broomrocket.ReferenceFinder]
+    placement_strategies: typing.List[broomrocket.PlacementStrategy]
+
+    @classmethod
+    def create_default(
+            cls,
+            nlp: typing.Optional[broomrocket.NLPProvider] = None
+    ) -> typing.ForwardRef("BroomrocketComponents"):
+        return cls(
             [
                 broomrocket.DummyMeshProvider(),
                 broomrocket.LocalMeshProvider(),
                 broomrocket.SketchfabMeshProvider()
             ],
-            broomrocket.SpaCyNLPProvider(),
+            nlp if nlp is not None else broomrocket.SpaCyNLPProvider(),
             [
                 broomrocket.NamedReferenceFinder()
             ],
@@ -209,92 +359,332 @@ class MessageHandler:
             ],
         )
 
-    def send_request(self, data):
-        message_id = str(uuid.uuid4())
+    def create_broomrocket(self, engine: broomrocket.Engine) -> Broomrocket:
+        return broomrocket.Broomrocket(
+            engine,
+            self.mesh_providers,
+            self.nlp,
+            self.reference_finders,
+            self.placement_strategies
+        )
+
+
+class MessageHandler:
+    broomrocket: Broomrocket
+    message_queue: typing.Dict[str, asyncio.Future]
+    loop: asyncio.AbstractEventLoop
+    _moved_meshes: typing.Dict[str, SocketLoadedMesh]
+    _in_flight: typing.List[concurrent.futures.Future]
+
+    # Decoders hold no per-message state, so they are shared by all connections.
+    load_gltf_decoder = msgspec.msgpack.Decoder(WireLoadGLTFResponse)
+    list_objects_decoder = msgspec.msgpack.Decoder(WireListObjectsResponse)
+    client_request_decoder = msgspec.msgpack.Decoder(WireClientRequest)
+
+    # The data of a successful response never changes, so it is encoded only once.
+    _ok_data = msgspec.Raw(msgspec.msgpack.encode({"status": "ok", "message": "Executed successfully."}))
+
+    def __init__(
+            self,
+            message_writer: MessageWriter,
+            loop: asyncio.AbstractEventLoop,
+            components: BroomrocketComponents
+    ):
+        self.message_queue = {}
+        self.message_writer = message_writer
+        self.loop = loop
+        # Message IDs only need to be unique among the requests in flight on this connection.
+        self._next_id = itertools.count()
+        self._closed = False
+        # Meshes moved since the last flush, keyed by name. Only used from the thread running the pipeline.
+        self._moved_meshes = {}
+        # Requests submitted by the pipeline that have not been waited for yet.
+        self._in_flight = []
+
+        self.broomrocket = components.create_broomrocket(SocketEngine(self))
+
+    async def send_request(self, data):
+        if self._closed:
+            raise ConnectionError("Connection closed.")
+        message_id = str(next(self._next_id))
+        future = self.loop.create_future()
+        self.message_queue[message_id] = future
         self.message_writer.send({
-            "type": "request",
+            "type": MessageType.REQUEST,
             "id": message_id,
             "data": data
         })
-        return self.message_reader.read_next()["data"]
+        return await future
+
+    def submit_request(self, data) -> concurrent.futures.Future:
+        """
+        This method sends a request from a worker thread without waiting for the response. The Broomrocket pipeline runs
+        outside the event loop and calls the engine synchronously, so the request is handed over to the event loop here.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.send_request(data), self.loop)
+        self._in_flight.append(future)
+        return future
+
+    def wait_for_responses(self):
+        """
+        This method waits until the client has responded to all submitted requests.
+        """
+        in_flight = self._in_flight
+        self._in_flight = []
+        for future in in_flight:
+            future.result()
 
-    def on_request(self, message):
+    def send_request_blocking(self, data):
+        """
+        This method sends a request from a worker thread and waits for the response. Earlier requests still in flight
+        are waited for as well, as the response may depend on them.
+        """
+        future = self.submit_request(data)
+        self.wait_for_responses()
+        return future.result()
+
+    def mesh_moved(self, mesh: SocketLoadedMesh):
+        self._moved_meshes[mesh.name] = mesh
+
+    def flush_moves(self):
+        """
+        This method sends one move request with the final translation for each mesh moved since the last flush. The
+        placement strategies move meshes one axis at a time, so this saves several round trips per mesh. It is called
+        before any other request to the client and when the pipeline finishes.
+        """
+        moved_meshes = self._moved_meshes
+        self._moved_meshes = {}
+        for mesh in moved_meshes.values():
+            self.submit_request({
+                "command": Command.MOVE_MESH,
+                "name": mesh.name,
+                "translation": mesh.translation.to_dict()
+            })
+
+    def _run(self, request: WireClientRequest):
         try:
             self.broomrocket.run(
-                message["data"]["mesh_provider_id"],
-                message["data"]["mesh_provider_parameters"],
-                message["data"]["sentence"],
+                request.mesh_provider_id,
+                request.mesh_provider_parameters,
+                request.sentence,
                 broomrocket.PythonLogger()
             )
+        except Exception:
+            # Still send the moves made so far, but report the original error rather than one from the cleanup.
+            try:
+                self.flush_moves()
+                self.wait_for_responses()
+            except Exception:
+                logger.exception("Failed to complete outstanding requests after the pipeline failed")
+            raise
+        self.flush_moves()
+        self.wait_for_responses()
+
+    def on_response(self, message: WireMessage):
+        future = self.message_queue.pop(message.id, None)
+        if future is not None and not future.done():
+            future.set_result(message.data)
+
+    def on_close(self, error: typing.Optional[Exception] = None):
+        """
+        This method fails all requests still waiting for a response when the connection is closed. If the connection is
+        closed because of an error, the requests fail with that error.
+        """
+        self._closed = True
+        if error is None:
+            error = ConnectionError("Connection closed before a response was received.")
+        for future in self.message_queue.values():
+            if not future.done():
+                future.set_exception(error)
+        self.message_queue.clear()
+
+    async def on_request(self, message: WireMessage):
+        try:
+            request = self.client_request_decoder.decode(message.data)
+            await self.loop.run_in_executor(None, self._run, request)
             self.message_writer.send({
-                "type": "response",
-                "id": message["id"],
-                "data": {"status": "ok", "message": "Executed successfully."}
+                "type": MessageType.RESPONSE,
+                "id": message.id,
+                "data": self._ok_data
             })
         except Exception as e:
             import traceback
             print(traceback.format_exc())
             self.message_writer.send({
-                "type": "response",
-                "id": message["id"],
+                "type": MessageType.RESPONSE,
+                "id": message.id,
                 "data": {"status": "error", "message": str(e)}
             })
 
 
-class ClientHandler(threading.Thread, MessageWriter, MessageReader):
-    client_socket: socket.socket
+class ClientHandler(MessageWriter, MessageReader):
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
     message_handler: MessageHandler
+    _pending: bytearray
+    _flush_scheduled: bool
+
+    _encoder = msgspec.msgpack.Encoder()
+    _decoder = msgspec.msgpack.Decoder(WireMessage)
+
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            components: BroomrocketComponents
+    ):
+        self.reader = reader
+        self.writer = writer
+        self._pending = bytearray()
+        self._flush_scheduled = False
+        self.message_handler = MessageHandler(self, asyncio.get_running_loop(), components)
+
+    async def run(self):
+        try:
+            try:
+                request = await self.read_next()
+            except ConnectionError:
+                return
+            except msgspec.DecodeError as e:
+                logger.error("Closing connection after receiving an invalid message: %s", e)
+                return
+            if request is None:
+                return
+            response_reader = asyncio.create_task(self._read_responses())
+            try:
+                await self.message_handler.on_request(request)
+            finally:
+                response_reader.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await response_reader
+        finally:
+            self._flush()
+            self.writer.close()
+            with contextlib.suppress(ConnectionError):
+                await self.writer.wait_closed()
 
-    def __init__(self, client_ip, client_port, client_socket):
-        threading.Thread.__init__(self)
-        self.client_socket = client_socket
-        self.message_handler = MessageHandler(self, self)
-
-    def run(self):
+    async def _read_responses(self):
+        """
+        This method reads the client's responses to our requests while the client request is being processed.
+        """
+        error = None
         try:
-            self.message_handler.on_request(self.read_next())
+            while True:
+                message = await self.read_next()
+                if message is None:
+                    return
+                if message.type == MessageType.RESPONSE:
+                    self.message_handler.on_response(message)
+        except ConnectionError:
+            # The client went away mid-frame; on_close fails the outstanding requests.
+            return
+        except msgspec.DecodeError as e:
+            # The stream can no longer be trusted. The outstanding requests fail with the decode error, which makes the
+            # pipeline finish, after which run() closes the connection.
+            logger.error("Closing connection after receiving an invalid message: %s", e)
+            error = e
         finally:
-            self.client_socket.close()
+            self.message_handler.on_close(error)
 
     def send(self, message):
-        msg = json.dumps(message)
-        self.client_socket.send(struct.pack("<l", len(msg)))
-        self.client_socket.send(msg.encode())
-
-    def read_next(self):
-        data = self.client_socket.recv(4)
-        if len(data) < 4:
-            self.client_socket.close()
-            return
-        [message_length] = struct.unpack("<l", data)
-        message_data: bytes = b""
-        while len(message_data) < message_length:
-            message_data += self.client_socket.recv(message_length - len(message_data))
-        print(message_data.decode())
-        message = json.loads(message_data)
+        """
+        This method queues a message for sending. All messages queued within the same event loop iteration are written
+        to the socket together.
+        """
+        # The message is encoded straight into the pending buffer after a placeholder header, which is then filled in
+        # with the payload length. This avoids copying the payload to prepend the header or to join the messages.
+        start = len(self._pending)
+        self._pending.extend(_HEADER.pack(0))
+        try:
+            self._encoder.encode_into(message, self._pending, -1)
+        except Exception:
+            # Drop the placeholder and any partially encoded payload so the queued frames stay intact.
+            del self._pending[start:]
+            raise
+        _HEADER.pack_into(self._pending, start, len(self._pending) - start - _HEADER.size)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self._pending:
+            # The transport may keep a reference to the buffer, so it is replaced rather than cleared.
+            self.writer.write(self._pending)
+            self._pending = bytearray()
+
+    async def read_next(self) -> typing.Optional[WireMessage]:
+        message_data = await read_frame(self.reader)
+        if message_data is None:
+            return None
+        message = self._decoder.decode(message_data)
+        logger.debug("Received %s %s (%d bytes)", message.type, message.id, len(message_data))
         return message
 
 
-def main():
-    host = "127.0.0.1"
-    port = 3333
+async def read_frame(reader: asyncio.StreamReader) -> typing.Optional[bytes]:
+    """
+    This function reads the payload of one length-prefixed frame. It returns None if the connection is closed before
+    the next frame starts and raises a ConnectionError if it is closed in the middle of a frame.
+    """
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    [length] = _HEADER.unpack(header)
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError("Connection closed while reading message payload.") from e
+
+
+async def handle_client(
+        components: BroomrocketComponents,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+):
+    await ClientHandler(reader, writer, components).run()
 
-    listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    listen_sock.bind((host, port))
 
-    listen_sock.listen()
-    threads = []
+async def main_async():
+    host = "127.0.0.1"
+    port = 3333
 
+    nlp_executor = None
+    nlp_processes = int(os.environ.get("NLP_PROCESSES", 0))
+    if nlp_processes > 0:
+        # Forking a process that already runs threads is unsafe, so the workers are spawned instead.
+        nlp_executor = ProcessPoolExecutor(
+            max_workers=nlp_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_nlp_worker
+        )
+        components = BroomrocketComponents.create_default(ProcessPoolNLPProvider(nlp_executor))
+    else:
+        components = BroomrocketComponents.create_default()
+
+    # The Broomrocket pipelines run on the default executor. Its size bounds how many of them run at the same time,
+    # regardless of the number of connections.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.environ.get("THREAD_POOL_SIZE", 32)))
+    )
     try:
-        while True:
-            (client_socket, (ip, port)) = listen_sock.accept()
-            client_handler = ClientHandler(ip, port, client_socket)
-            client_handler.start()
-            threads.append(client_handler)
+        if nlp_executor is not None:
+            # Workers are started on demand, so start them all now. This loads the spaCy model before the first
+            # requests arrive and fails startup, like the in-process provider does, if a worker cannot load it.
+            await asyncio.gather(*(
+                asyncio.wrap_future(nlp_executor.submit(_check_worker)) for _ in range(nlp_processes)
+            ))
+        server = await asyncio.start_server(functools.partial(handle_client, components), host, port)
+        async with server:
+            await server.serve_forever()
     finally:
-        for thread in threads:
-            thread.join()
+        if nlp_executor is not None:
+            nlp_executor.shutdown()
+
+
+def main():
+    asyncio.run(main_async())
 
 
 if __name__ == "__main__":